@@ -1,29 +1,174 @@
 import os
 import json
+import zlib
 import asyncio
 from uuid import uuid4
 from datetime import datetime
-from typing import Optional, List
+from typing import Optional, List, Dict
 from contextlib import asynccontextmanager
 
 import redis.asyncio as redis
-from fastapi import FastAPI, HTTPException
+from redis.asyncio.client import PubSub
+from redis.exceptions import MovedError
+from fastapi import FastAPI, HTTPException, Query
 from fastapi.middleware.cors import CORSMiddleware
 from fastapi.responses import StreamingResponse
 from pydantic import BaseModel
 
 
 REDIS_URL = os.getenv("REDIS_URL", "redis://localhost:6379")
+REDIS_CLUSTER = os.getenv("REDIS_CLUSTER", "false").lower() in ("1", "true", "yes")
+JOB_SHARDS = int(os.getenv("JOB_SHARDS", "1"))
+if JOB_SHARDS < 1:
+    raise ValueError(f"JOB_SHARDS must be at least 1, got {JOB_SHARDS}")
 
 redis_pool: Optional[redis.Redis] = None
+# Cluster clients can't subscribe, so in cluster mode each job's events are
+# read with SSUBSCRIBE over a plain connection to the node owning its channel.
+node_pools: Dict[str, redis.Redis] = {}
+
+
+# Keys are Redis Cluster compatible: everything belonging to one job shares the
+# {job_id} hash tag, and each shard's queue and index share the {shard} tag.
+def job_key(job_id: str) -> str:
+    return f"jobs:{{{job_id}}}"
+
+
+def events_channel(job_id: str) -> str:
+    return f"jobs:{{{job_id}}}:events"
+
+
+def queue_key(shard: int) -> str:
+    return f"jobs:queue:{{{shard}}}"
+
+
+def index_key(shard: int) -> str:
+    return f"jobs:index:{{{shard}}}"
+
+
+def shard_for(job_id: str) -> int:
+    return zlib.crc32(job_id.encode()) % JOB_SHARDS
+
+
+# Pre-sharding layout: one global index and queue, job hashes at jobs:<id>
+LEGACY_INDEX_KEY = "jobs:index"
+LEGACY_QUEUE_KEY = "jobs:queue"
+
+
+async def migrate_legacy_keys(r: redis.Redis):
+    """Move jobs stored under the pre-sharding key layout into their shards.
+
+    Safe to run from several API replicas at once: every step tolerates
+    another replica having already done it.
+    """
+    while True:
+        entries = await r.zrange(LEGACY_INDEX_KEY, 0, 99, withscores=True)
+        if not entries:
+            break
+        for job_id, score in entries:
+            try:
+                await r.rename(f"jobs:{job_id}", job_key(job_id))
+            except redis.ResponseError:
+                pass  # Already renamed by another replica (or never existed)
+            await r.zadd(index_key(shard_for(job_id)), {job_id: score})
+            # Removed one at a time so entries added meanwhile by an old API
+            # are picked up on the next pass instead of being dropped
+            await r.zrem(LEGACY_INDEX_KEY, job_id)
+
+    # Move oldest first so each shard queue keeps the original order. LMOVE
+    # never leaves an entry outside a queue; if another replica moved the
+    # peeked entry first, the one moved here may land in a different shard,
+    # which workers drain just the same.
+    while True:
+        queue_data = await r.lindex(LEGACY_QUEUE_KEY, -1)
+        if queue_data is None:
+            break
+        job_id = json.loads(queue_data)["job_id"]
+        await r.lmove(LEGACY_QUEUE_KEY, queue_key(shard_for(job_id)), "RIGHT", "LEFT")
 
 
 @asynccontextmanager
 async def lifespan(app: FastAPI):
     global redis_pool
-    redis_pool = redis.from_url(REDIS_URL, decode_responses=True)
+    if REDIS_CLUSTER:
+        redis_pool = redis.RedisCluster.from_url(REDIS_URL, decode_responses=True)
+        await redis_pool.initialize()
+    else:
+        redis_pool = redis.from_url(REDIS_URL, decode_responses=True)
+        # Cluster deployments start fresh; only a single node can hold old keys
+        await migrate_legacy_keys(redis_pool)
     yield
     await redis_pool.close()
+    for pool in node_pools.values():
+        await pool.close()
+    node_pools.clear()
+
+
+class ShardedPubSub(PubSub):
+    """PubSub that subscribes to shard channels and keeps them on reconnect.
+
+    The async PubSub in redis-py has no ssubscribe(), and on reconnect only
+    replays the channels it tracks itself, so SSUBSCRIBE is tracked here.
+    """
+
+    def __init__(self, *args, **kwargs):
+        super().__init__(*args, **kwargs)
+        self.sharded_channels = set()
+
+    async def ssubscribe_channel(self, channel: str):
+        await self.execute_command("SSUBSCRIBE", channel)
+        self.sharded_channels.add(channel)
+
+    async def sunsubscribe_channel(self, channel: str):
+        self.sharded_channels.discard(channel)
+        await self.execute_command("SUNSUBSCRIBE", channel)
+
+    async def on_connect(self, connection):
+        await super().on_connect(connection)
+        if self.sharded_channels:
+            await self.execute_command("SSUBSCRIBE", *self.sharded_channels)
+
+
+def events_pubsub(channel: str):
+    """Pub/sub connection that can receive messages on a job's events channel."""
+    if not REDIS_CLUSTER:
+        return redis_pool.pubsub()
+
+    node = redis_pool.get_node_from_key(channel)
+    if node.name not in node_pools:
+        # from_pool() lets close() at shutdown disconnect the pool as well
+        node_pools[node.name] = redis.Redis.from_pool(redis.ConnectionPool(
+            connection_class=node.connection_class, **node.connection_kwargs
+        ))
+    return ShardedPubSub(node_pools[node.name].connection_pool)
+
+
+async def subscribe_events(channel: str):
+    """Subscribe to a job's events channel on the node that currently owns it."""
+    pubsub = events_pubsub(channel)
+    if REDIS_CLUSTER:
+        await pubsub.ssubscribe_channel(channel)
+    else:
+        await pubsub.subscribe(channel)
+    return pubsub
+
+
+async def resubscribe_events(pubsub, channel: str, error: Exception):
+    """Replace a subscription broken by a connection error or a reshard.
+
+    After a reshard or failover the channel's slot answers MOVED (or its old
+    node is gone), so the slot map is refreshed before subscribing on the
+    new owner.
+    """
+    if isinstance(error, redis.ResponseError):
+        moved = isinstance(error, MovedError) or str(error).startswith("MOVED")
+        if not (REDIS_CLUSTER and moved):
+            raise error
+
+    await pubsub.close()
+    if REDIS_CLUSTER:
+        await redis_pool.nodes_manager.initialize()
+    return await subscribe_events(channel)
 
 
 app = FastAPI(title="Subconscious Demo API", lifespan=lifespan)
@@ -58,6 +203,17 @@ class JobListResponse(BaseModel):
     jobs: List[JobState]
 
 
+def job_state_from_hash(job_id: str, job_data: dict) -> JobState:
+    return JobState(
+        id=job_data.get("id", job_id),
+        prompt=job_data.get("prompt", ""),
+        status=job_data.get("status", "unknown"),
+        estimated_wait_seconds=int(job_data["estimated_wait_seconds"]) if job_data.get("estimated_wait_seconds") else None,
+        created_at=job_data.get("created_at"),
+        error=job_data.get("error"),
+    )
+
+
 @app.post("/jobs", response_model=JobResponse)
 async def create_job(request: JobRequest):
     """Create a new inference job and queue it for processing."""
@@ -72,35 +228,47 @@ async def create_job(request: JobRequest):
         "estimated_wait_seconds": "30",
         "created_at": created_at,
     }
-    await redis_pool.hset(f"jobs:{job_id}", mapping=job_data)
-
-    # Add to jobs index (sorted set with timestamp as score for ordering)
-    await redis_pool.zadd("jobs:index", {job_id: datetime.utcnow().timestamp()})
+    # Written before queueing so a worker never picks up a job whose hash
+    # doesn't exist yet (and then has its status overwritten with "queued")
+    await redis_pool.hset(job_key(job_id), mapping=job_data)
 
-    # Push job to queue for worker to pick up
+    shard = shard_for(job_id)
     queue_data = json.dumps({"job_id": job_id, "prompt": request.prompt})
-    await redis_pool.lpush("jobs:queue", queue_data)
+
+    # Index and queue share the {shard} hash tag, so they can go in one MULTI.
+    # The cluster client in redis-py refuses transactions; there both commands
+    # still go to the same node over one connection, in order.
+    async with redis_pool.pipeline(transaction=not REDIS_CLUSTER) as pipe:
+        # Add to shard's jobs index (sorted set with timestamp as score for ordering)
+        pipe.zadd(index_key(shard), {job_id: datetime.utcnow().timestamp()})
+        # Push job to shard's queue for a worker to pick up
+        pipe.lpush(queue_key(shard), queue_data)
+        await pipe.execute()
 
     return JobResponse(job_id=job_id)
 
 
 @app.get("/jobs", response_model=JobListResponse)
-async def list_jobs(limit: int = 50):
-    # Get job IDs from sorted set (newest first)
-    job_ids = await redis_pool.zrevrange("jobs:index", 0, limit - 1)
-
-    jobs = []
-    for job_id in job_ids:
-        job_data = await redis_pool.hgetall(f"jobs:{job_id}")
-        if job_data:
-            jobs.append(JobState(
-                id=job_data.get("id", job_id),
-                prompt=job_data.get("prompt", ""),
-                status=job_data.get("status", "unknown"),
-                estimated_wait_seconds=int(job_data["estimated_wait_seconds"]) if job_data.get("estimated_wait_seconds") else None,
-                created_at=job_data.get("created_at"),
-                error=job_data.get("error"),
-            ))
+async def list_jobs(limit: int = Query(50, ge=1)):
+    # Take the newest `limit` entries from every shard's index, then merge
+    shard_results = await asyncio.gather(*(
+        redis_pool.zrevrange(index_key(shard), 0, limit - 1, withscores=True)
+        for shard in range(JOB_SHARDS)
+    ))
+    entries = [entry for result in shard_results for entry in result]
+    entries.sort(key=lambda entry: entry[1], reverse=True)
+    job_ids = [job_id for job_id, _ in entries[:limit]]
+
+    async with redis_pool.pipeline(transaction=False) as pipe:
+        for job_id in job_ids:
+            pipe.hgetall(job_key(job_id))
+        results = await pipe.execute()
+
+    jobs = [
+        job_state_from_hash(job_id, job_data)
+        for job_id, job_data in zip(job_ids, results)
+        if job_data
+    ]
 
     return JobListResponse(jobs=jobs)
 
@@ -108,19 +276,12 @@ async def list_jobs(limit: int = 50):
 @app.get("/jobs/{job_id}", response_model=JobState)
 async def get_job(job_id: str):
     """Get current state of a job."""
-    job_data = await redis_pool.hgetall(f"jobs:{job_id}")
+    job_data = await redis_pool.hgetall(job_key(job_id))
 
     if not job_data:
         raise HTTPException(status_code=404, detail="Job not found")
 
-    return JobState(
-        id=job_data.get("id", job_id),
-        prompt=job_data.get("prompt", ""),
-        status=job_data.get("status", "unknown"),
-        estimated_wait_seconds=int(job_data["estimated_wait_seconds"]) if job_data.get("estimated_wait_seconds") else None,
-        created_at=job_data.get("created_at"),
-        error=job_data.get("error"),
-    )
+    return job_state_from_hash(job_id, job_data)
 
 
 @app.get("/jobs/{job_id}/stream")
@@ -128,18 +289,17 @@ async def stream_job(job_id: str):
     """SSE endpoint for streaming job updates."""
 
     # Check job exists
-    exists = await redis_pool.exists(f"jobs:{job_id}")
+    exists = await redis_pool.exists(job_key(job_id))
     if not exists:
         raise HTTPException(status_code=404, detail="Job not found")
 
     async def event_generator():
-        pubsub = redis_pool.pubsub()
-        channel = f"jobs:{job_id}:events"
-        await pubsub.subscribe(channel)
+        channel = events_channel(job_id)
+        pubsub = await subscribe_events(channel)
 
         try:
             # Send initial state
-            job_data = await redis_pool.hgetall(f"jobs:{job_id}")
+            job_data = await redis_pool.hgetall(job_key(job_id))
             initial_event = {
                 "type": "status",
                 "payload": {
@@ -156,11 +316,13 @@ async def stream_job(job_id: str):
             while True:
                 try:
                     message = await asyncio.wait_for(
-                        pubsub.get_message(ignore_subscribe_messages=True),
+                        pubsub.get_message(),
                         timeout=1.0
                     )
 
-                    if message and message["type"] == "message":
+                    # Sharded messages arrive as "smessage"; anything else is
+                    # a (un)subscribe confirmation
+                    if message and message["type"] in ("message", "smessage"):
                         data = message["data"]
                         yield f"data: {data}\n\n"
 
@@ -178,9 +340,12 @@ async def stream_job(job_id: str):
                         yield f"data: {json.dumps({'type': 'heartbeat', 'payload': {}})}\n\n"
                         last_heartbeat = current_time
 
+                except (redis.ConnectionError, redis.ResponseError) as e:
+                    pubsub = await resubscribe_events(pubsub, channel, e)
+
                 except asyncio.TimeoutError:
                     # Check if job completed while we were waiting
-                    job_data = await redis_pool.hgetall(f"jobs:{job_id}")
+                    job_data = await redis_pool.hgetall(job_key(job_id))
                     if job_data.get("status") in ["complete", "error"]:
                         break
 
@@ -191,7 +356,13 @@ async def stream_job(job_id: str):
                         last_heartbeat = current_time
 
         finally:
-            await pubsub.unsubscribe(channel)
+            try:
+                if REDIS_CLUSTER:
+                    await pubsub.sunsubscribe_channel(channel)
+                else:
+                    await pubsub.unsubscribe(channel)
+            except redis.ConnectionError:
+                pass  # Nothing to unsubscribe from on a dead connection
             await pubsub.close()
 
     return StreamingResponse(
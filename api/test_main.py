@@ -1,8 +1,10 @@
 import pytest
 import json
+import asyncio
 from unittest.mock import AsyncMock, patch, MagicMock
 from httpx import AsyncClient, ASGITransport
 from fakeredis import aioredis as fakeredis
+from redis.exceptions import MovedError
 
 import main
 
@@ -45,7 +47,7 @@ class TestCreateJob:
         assert "job_id" in data
 
         # Verify job was stored in Redis
-        job_data = await fake_redis.hgetall(f"jobs:{data['job_id']}")
+        job_data = await fake_redis.hgetall(main.job_key(data['job_id']))
         assert job_data["prompt"] == "Test prompt"
         assert job_data["status"] == "queued"
         assert "created_at" in job_data
@@ -59,7 +61,7 @@ class TestCreateJob:
         assert response.status_code == 200
 
         # Verify job was added to queue
-        queue_item = await fake_redis.rpop("jobs:queue")
+        queue_item = await fake_redis.rpop(main.queue_key(0))
         assert queue_item is not None
         queue_data = json.loads(queue_item)
         assert queue_data["prompt"] == "Test prompt"
@@ -74,7 +76,7 @@ class TestCreateJob:
         job_id = response.json()["job_id"]
 
         # Verify job was added to sorted set index
-        job_ids = await fake_redis.zrange("jobs:index", 0, -1)
+        job_ids = await fake_redis.zrange(main.index_key(0), 0, -1)
         assert job_id in job_ids
 
     @pytest.mark.asyncio
@@ -88,7 +90,7 @@ class TestGetJob:
     async def test_get_job_success(self, client, fake_redis):
         # Create a job first
         job_id = "test-job-123"
-        await fake_redis.hset(f"jobs:{job_id}", mapping={
+        await fake_redis.hset(main.job_key(job_id), mapping={
             "id": job_id,
             "prompt": "Test prompt",
             "status": "running",
@@ -113,7 +115,7 @@ class TestGetJob:
     @pytest.mark.asyncio
     async def test_get_job_with_error(self, client, fake_redis):
         job_id = "error-job"
-        await fake_redis.hset(f"jobs:{job_id}", mapping={
+        await fake_redis.hset(main.job_key(job_id), mapping={
             "id": job_id,
             "prompt": "Test",
             "status": "error",
@@ -139,13 +141,13 @@ class TestListJobs:
         # Create multiple jobs
         for i in range(3):
             job_id = f"job-{i}"
-            await fake_redis.hset(f"jobs:{job_id}", mapping={
+            await fake_redis.hset(main.job_key(job_id), mapping={
                 "id": job_id,
                 "prompt": f"Prompt {i}",
                 "status": "complete",
                 "created_at": f"2024-01-0{i+1}T00:00:00Z"
             })
-            await fake_redis.zadd("jobs:index", {job_id: float(i)})
+            await fake_redis.zadd(main.index_key(0), {job_id: float(i)})
 
         response = await client.get("/jobs")
         assert response.status_code == 200
@@ -155,19 +157,19 @@ class TestListJobs:
     @pytest.mark.asyncio
     async def test_list_jobs_ordered_by_newest(self, client, fake_redis):
         # Create jobs with different timestamps
-        await fake_redis.hset("jobs:old", mapping={
+        await fake_redis.hset(main.job_key("old"), mapping={
             "id": "old",
             "prompt": "Old job",
             "status": "complete"
         })
-        await fake_redis.zadd("jobs:index", {"old": 1.0})
+        await fake_redis.zadd(main.index_key(0), {"old": 1.0})
 
-        await fake_redis.hset("jobs:new", mapping={
+        await fake_redis.hset(main.job_key("new"), mapping={
             "id": "new",
             "prompt": "New job",
             "status": "complete"
         })
-        await fake_redis.zadd("jobs:index", {"new": 2.0})
+        await fake_redis.zadd(main.index_key(0), {"new": 2.0})
 
         response = await client.get("/jobs")
         assert response.status_code == 200
@@ -180,17 +182,116 @@ class TestListJobs:
         # Create 10 jobs
         for i in range(10):
             job_id = f"job-{i}"
-            await fake_redis.hset(f"jobs:{job_id}", mapping={
+            await fake_redis.hset(main.job_key(job_id), mapping={
                 "id": job_id,
                 "prompt": f"Prompt {i}",
                 "status": "complete"
             })
-            await fake_redis.zadd("jobs:index", {job_id: float(i)})
+            await fake_redis.zadd(main.index_key(0), {job_id: float(i)})
 
         response = await client.get("/jobs?limit=5")
         assert response.status_code == 200
         assert len(response.json()["jobs"]) == 5
 
+    @pytest.mark.asyncio
+    async def test_list_jobs_rejects_non_positive_limit(self, client):
+        for limit in (0, -1):
+            response = await client.get(f"/jobs?limit={limit}")
+            assert response.status_code == 422  # Validation error
+
+
+class TestSharding:
+    def test_job_keys_share_hash_tag(self):
+        assert main.job_key("abc") == "jobs:{abc}"
+        assert main.events_channel("abc") == "jobs:{abc}:events"
+
+    def test_shard_keys_share_hash_tag(self):
+        assert main.queue_key(3) == "jobs:queue:{3}"
+        assert main.index_key(3) == "jobs:index:{3}"
+
+    @pytest.mark.asyncio
+    async def test_create_job_uses_job_shard(self, client, fake_redis, monkeypatch):
+        monkeypatch.setattr(main, "JOB_SHARDS", 4)
+        response = await client.post("/jobs", json={"prompt": "Test prompt"})
+        job_id = response.json()["job_id"]
+        shard = main.shard_for(job_id)
+
+        assert job_id in await fake_redis.zrange(main.index_key(shard), 0, -1)
+        queue_item = await fake_redis.rpop(main.queue_key(shard))
+        assert json.loads(queue_item)["job_id"] == job_id
+
+    @pytest.mark.asyncio
+    async def test_list_jobs_merges_shards(self, client, fake_redis, monkeypatch):
+        monkeypatch.setattr(main, "JOB_SHARDS", 3)
+        # Spread jobs round-robin over shards with increasing timestamps
+        for i in range(6):
+            job_id = f"job-{i}"
+            await fake_redis.hset(main.job_key(job_id), mapping={
+                "id": job_id,
+                "prompt": f"Prompt {i}",
+                "status": "complete"
+            })
+            await fake_redis.zadd(main.index_key(i % 3), {job_id: float(i)})
+
+        response = await client.get("/jobs?limit=4")
+        assert response.status_code == 200
+        ids = [job["id"] for job in response.json()["jobs"]]
+        assert ids == ["job-5", "job-4", "job-3", "job-2"]
+
+    @pytest.mark.asyncio
+    async def test_migrate_legacy_keys(self, client, fake_redis, monkeypatch):
+        monkeypatch.setattr(main, "JOB_SHARDS", 4)
+        for i in range(3):
+            job_id = f"job-{i}"
+            await fake_redis.hset(f"jobs:{job_id}", mapping={
+                "id": job_id,
+                "prompt": f"Prompt {i}",
+                "status": "queued"
+            })
+            await fake_redis.zadd("jobs:index", {job_id: float(i)})
+            await fake_redis.lpush("jobs:queue", json.dumps({"job_id": job_id, "prompt": f"Prompt {i}"}))
+
+        await main.migrate_legacy_keys(fake_redis)
+
+        assert not await fake_redis.exists("jobs:index", "jobs:queue", "jobs:job-0")
+        response = await client.get("/jobs")
+        ids = [job["id"] for job in response.json()["jobs"]]
+        assert ids == ["job-2", "job-1", "job-0"]
+
+        for i in range(3):
+            job_id = f"job-{i}"
+            queue_item = await fake_redis.rpop(main.queue_key(main.shard_for(job_id)))
+            assert json.loads(queue_item)["job_id"] == job_id
+
+    @pytest.mark.asyncio
+    async def test_migrate_legacy_keys_concurrently(self, client, fake_redis, monkeypatch):
+        monkeypatch.setattr(main, "JOB_SHARDS", 4)
+        for i in range(5):
+            job_id = f"job-{i}"
+            await fake_redis.hset(f"jobs:{job_id}", mapping={
+                "id": job_id,
+                "prompt": f"Prompt {i}",
+                "status": "queued"
+            })
+            await fake_redis.zadd("jobs:index", {job_id: float(i)})
+            await fake_redis.lpush("jobs:queue", json.dumps({"job_id": job_id, "prompt": f"Prompt {i}"}))
+
+        # Two API replicas starting at the same time
+        await asyncio.gather(
+            main.migrate_legacy_keys(fake_redis),
+            main.migrate_legacy_keys(fake_redis),
+        )
+
+        assert not await fake_redis.exists("jobs:index", "jobs:queue")
+        response = await client.get("/jobs")
+        ids = [job["id"] for job in response.json()["jobs"]]
+        assert ids == ["job-4", "job-3", "job-2", "job-1", "job-0"]
+
+        queued = []
+        for shard in range(4):
+            queued += await fake_redis.lrange(main.queue_key(shard), 0, -1)
+        assert sorted(json.loads(item)["job_id"] for item in queued) == [f"job-{i}" for i in range(5)]
+
 
 class TestStreamJob:
     @pytest.mark.asyncio
@@ -208,7 +309,7 @@ class TestStreamJob:
         tests with a real Redis instance.
         """
         job_id = "stream-job"
-        await fake_redis.hset(f"jobs:{job_id}", mapping={
+        await fake_redis.hset(main.job_key(job_id), mapping={
             "id": job_id,
             "prompt": "Test",
             "status": "complete",
@@ -218,3 +319,74 @@ class TestStreamJob:
         async with client.stream("GET", f"/jobs/{job_id}/stream") as response:
             assert response.status_code == 200
             assert "text/event-stream" in response.headers["content-type"]
+
+    @pytest.mark.asyncio
+    async def test_stream_job_sharded_events(self, client, fake_redis, monkeypatch):
+        monkeypatch.setattr(main, "REDIS_CLUSTER", True)
+        monkeypatch.setattr(main, "events_pubsub", lambda channel: main.ShardedPubSub(fake_redis.connection_pool))
+        job_id = "sharded-job"
+        await fake_redis.hset(main.job_key(job_id), mapping={
+            "id": job_id,
+            "prompt": "Test",
+            "status": "running"
+        })
+
+        async def publish():
+            await asyncio.sleep(0.2)
+            channel = main.events_channel(job_id)
+            await fake_redis.spublish(channel, json.dumps({"type": "node", "payload": {"node": {"id": "n1"}}}))
+            await fake_redis.spublish(channel, json.dumps({"type": "status", "payload": {"status": "complete"}}))
+
+        publisher = asyncio.create_task(publish())
+        response = await asyncio.wait_for(client.get(f"/jobs/{job_id}/stream"), timeout=5)
+        await publisher
+
+        events = [json.loads(line[len("data: "):]) for line in response.text.split("\n\n") if line]
+        assert [event["type"] for event in events] == ["status", "node", "status"]
+        assert events[-1]["payload"]["status"] == "complete"
+
+    @pytest.mark.asyncio
+    async def test_stream_job_resubscribes_after_moved(self, client, fake_redis, monkeypatch):
+        monkeypatch.setattr(main, "REDIS_CLUSTER", True)
+        fake_redis.nodes_manager = MagicMock(initialize=AsyncMock())
+        job_id = "moved-job"
+        await fake_redis.hset(main.job_key(job_id), mapping={
+            "id": job_id,
+            "prompt": "Test",
+            "status": "running"
+        })
+
+        # The first node answers MOVED, as after a reshard
+        moved_pubsub = main.ShardedPubSub(fake_redis.connection_pool)
+        moved_pubsub.get_message = AsyncMock(side_effect=MovedError("1234 10.0.0.2:6379"))
+        pubsubs = [moved_pubsub, main.ShardedPubSub(fake_redis.connection_pool)]
+        monkeypatch.setattr(main, "events_pubsub", lambda channel: pubsubs.pop(0))
+
+        async def publish():
+            await asyncio.sleep(0.2)
+            channel = main.events_channel(job_id)
+            await fake_redis.spublish(channel, json.dumps({"type": "status", "payload": {"status": "complete"}}))
+
+        publisher = asyncio.create_task(publish())
+        response = await asyncio.wait_for(client.get(f"/jobs/{job_id}/stream"), timeout=5)
+        await publisher
+
+        fake_redis.nodes_manager.initialize.assert_awaited_once()
+        assert not pubsubs
+        assert '"complete"' in response.text
+
+    @pytest.mark.asyncio
+    async def test_sharded_pubsub_resubscribes_on_reconnect(self, fake_redis):
+        pubsub = main.ShardedPubSub(fake_redis.connection_pool)
+        await pubsub.ssubscribe_channel("jobs:{abc}:events")
+        assert (await pubsub.get_message(timeout=0.1))["type"] == "ssubscribe"
+
+        await pubsub.connection.disconnect()
+        # Reading reconnects silently; SSUBSCRIBE must be sent again
+        assert (await pubsub.get_message(timeout=0.1))["type"] == "ssubscribe"
+
+        await fake_redis.spublish("jobs:{abc}:events", "hello")
+        message = await pubsub.get_message(timeout=0.1)
+        assert message["type"] == "smessage"
+        assert message["data"] == "hello"
+        await pubsub.close()
@@ -12,16 +12,69 @@ import redis
 sys.stdout.reconfigure(line_buffering=True)
 
 REDIS_URL = os.getenv("REDIS_URL", "redis://localhost:6379")
+REDIS_CLUSTER = os.getenv("REDIS_CLUSTER", "false").lower() in ("1", "true", "yes")
+JOB_SHARDS = int(os.getenv("JOB_SHARDS", "1"))
+if JOB_SHARDS < 1:
+    raise ValueError(f"JOB_SHARDS must be at least 1, got {JOB_SHARDS}")
+
+# Seconds a worker blocks on the shard queues before checking again
+POLL_TIMEOUT = 1
+
+
+# Key layout must match the API (see api/main.py)
+def job_key(job_id: str) -> str:
+    return f"jobs:{{{job_id}}}"
+
+
+def events_channel(job_id: str) -> str:
+    return f"jobs:{{{job_id}}}:events"
+
+
+def queue_key(shard: int) -> str:
+    return f"jobs:queue:{{{shard}}}"
 
 
 def create_redis_client():
+    if REDIS_CLUSTER:
+        return redis.RedisCluster.from_url(REDIS_URL, decode_responses=True)
     return redis.from_url(REDIS_URL, decode_responses=True)
 
 
+def pop_job(r, home_shard: int):
+    """Take the next job from any shard, starting with the home shard.
+
+    On a single node one BRPOP waits on every shard queue at once; the
+    home shard goes first so busy shards don't starve the others. In a
+    cluster BRPOP can't span shards (their queues live in different slots),
+    so sweep every queue with RPOP first, then block briefly on one. Workers
+    rotate the home shard, so a job on another shard waits at most about
+    POLL_TIMEOUT while they are idle.
+    """
+    keys = [queue_key((home_shard + offset) % JOB_SHARDS) for offset in range(JOB_SHARDS)]
+
+    if REDIS_CLUSTER:
+        for key in keys:
+            job_data = r.rpop(key)
+            if job_data:
+                return job_data
+        keys = keys[:1]
+
+    result = r.brpop(keys, timeout=POLL_TIMEOUT)
+    if result:
+        _, job_data = result
+        return job_data
+    return None
+
+
 def publish_event(r, job_id: str, event_type: str, payload: dict):
     """Publish an event to the job's pub/sub channel."""
     event = {"type": event_type, "payload": payload}
-    r.publish(f"jobs:{job_id}:events", json.dumps(event))
+    if REDIS_CLUSTER:
+        # Sharded pub/sub stays on the node owning the channel's slot instead
+        # of being broadcast to the whole cluster
+        r.spublish(events_channel(job_id), json.dumps(event))
+    else:
+        r.publish(events_channel(job_id), json.dumps(event))
 
 
 def update_job_status(r, job_id: str, status: str, estimated_wait: int = None):
@@ -29,7 +82,7 @@ def update_job_status(r, job_id: str, status: str, estimated_wait: int = None):
     updates = {"status": status}
     if estimated_wait is not None:
         updates["estimated_wait_seconds"] = str(estimated_wait)
-    r.hset(f"jobs:{job_id}", mapping=updates)
+    r.hset(job_key(job_id), mapping=updates)
 
     payload = {"status": status}
     if estimated_wait is not None:
@@ -198,15 +251,17 @@ def main():
         print(f"[Worker] Failed to connect to Redis: {e}")
         return
 
-    print("[Worker] Waiting for jobs...")
+    print(f"[Worker] Waiting for jobs on {JOB_SHARDS} shard(s)...")
+
+    # Start on a random shard and rotate so idle workers spread their blocking
+    home_shard = random.randrange(JOB_SHARDS)
 
     while True:
         try:
-            # Block waiting for a job
-            result = r.brpop("jobs:queue", timeout=0)
+            job_data = pop_job(r, home_shard)
+            home_shard = (home_shard + 1) % JOB_SHARDS
 
-            if result:
-                _, job_data = result
+            if job_data:
                 job = json.loads(job_data)
                 job_id = job["job_id"]
                 prompt = job["prompt"]
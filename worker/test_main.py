@@ -0,0 +1,100 @@
+import json
+
+import pytest
+import fakeredis
+from unittest.mock import MagicMock
+
+import main
+
+
+@pytest.fixture(params=[False, True], ids=["single-node", "cluster"])
+def fake_redis(request, monkeypatch):
+    """Create a fake Redis instance with jobs spread over 4 shards."""
+    monkeypatch.setattr(main, "REDIS_CLUSTER", request.param)
+    monkeypatch.setattr(main, "JOB_SHARDS", 4)
+    monkeypatch.setattr(main, "POLL_TIMEOUT", 0.1)
+    redis = fakeredis.FakeRedis(decode_responses=True)
+    yield redis
+    redis.flushall()
+    redis.close()
+
+
+class TestPopJob:
+    def test_pop_job_from_home_shard(self, fake_redis):
+        fake_redis.lpush(main.queue_key(1), "home-job")
+
+        assert main.pop_job(fake_redis, 1) == "home-job"
+
+    def test_pop_job_from_other_shard(self, fake_redis):
+        fake_redis.lpush(main.queue_key(3), "other-job")
+
+        assert main.pop_job(fake_redis, 1) == "other-job"
+        assert fake_redis.llen(main.queue_key(3)) == 0
+
+    def test_pop_job_prefers_home_shard(self, fake_redis):
+        fake_redis.lpush(main.queue_key(0), "other-job")
+        fake_redis.lpush(main.queue_key(2), "home-job")
+
+        assert main.pop_job(fake_redis, 2) == "home-job"
+
+    def test_pop_job_oldest_first_within_shard(self, fake_redis):
+        fake_redis.lpush(main.queue_key(2), "first")
+        fake_redis.lpush(main.queue_key(2), "second")
+
+        assert main.pop_job(fake_redis, 0) == "first"
+        assert main.pop_job(fake_redis, 0) == "second"
+
+    def test_pop_job_returns_none_when_empty(self, fake_redis):
+        assert main.pop_job(fake_redis, 2) is None
+
+
+class TestPopJobRoundTrips:
+    def test_single_node_blocks_on_all_shards_at_once(self, monkeypatch):
+        monkeypatch.setattr(main, "REDIS_CLUSTER", False)
+        monkeypatch.setattr(main, "JOB_SHARDS", 3)
+        r = MagicMock()
+        r.brpop.return_value = None
+
+        assert main.pop_job(r, 1) is None
+        r.rpop.assert_not_called()
+        r.brpop.assert_called_once_with(
+            [main.queue_key(1), main.queue_key(2), main.queue_key(0)],
+            timeout=main.POLL_TIMEOUT,
+        )
+
+    def test_cluster_sweeps_then_blocks_on_home_shard(self, monkeypatch):
+        monkeypatch.setattr(main, "REDIS_CLUSTER", True)
+        monkeypatch.setattr(main, "JOB_SHARDS", 3)
+        r = MagicMock()
+        r.rpop.return_value = None
+        r.brpop.return_value = None
+
+        assert main.pop_job(r, 1) is None
+        assert [call.args[0] for call in r.rpop.call_args_list] == [
+            main.queue_key(1), main.queue_key(2), main.queue_key(0)
+        ]
+        r.brpop.assert_called_once_with([main.queue_key(1)], timeout=main.POLL_TIMEOUT)
+
+
+class TestPublishEvent:
+    def test_publish_event_single_node(self, monkeypatch):
+        monkeypatch.setattr(main, "REDIS_CLUSTER", False)
+        r = MagicMock()
+
+        main.publish_event(r, "abc", "status", {"status": "running"})
+
+        r.publish.assert_called_once_with(
+            "jobs:{abc}:events", json.dumps({"type": "status", "payload": {"status": "running"}})
+        )
+        r.spublish.assert_not_called()
+
+    def test_publish_event_cluster_uses_sharded_pubsub(self, monkeypatch):
+        monkeypatch.setattr(main, "REDIS_CLUSTER", True)
+        r = MagicMock()
+
+        main.publish_event(r, "abc", "status", {"status": "running"})
+
+        r.spublish.assert_called_once_with(
+            "jobs:{abc}:events", json.dumps({"type": "status", "payload": {"status": "running"}})
+        )
+        r.publish.assert_not_called()